@@ -28,20 +28,26 @@ LEARNINGS = [
     {"category": "security", "title": "Implement proper CORS headers for API security", "content": "Problem: API accessible from malicious websites via browser.\nCause: Missing or overly permissive CORS configuration.\nSolution: Whitelist specific allowed origins only.\nCode: Access-Control-Allow-Origin: https://myapp.com\nResult: Only trusted sites can make browser requests to API.", "tags": ["http", "cors"], "type": "warning"},
 ]
 
+BATCH = 50
+
 uploaded = 0
-for l in LEARNINGS:
+for i in range(0, len(LEARNINGS), BATCH):
+    chunk = LEARNINGS[i:i + BATCH]
     try:
-        r = requests.post(f"{BASE_URL}/experiences",
+        r = requests.post(f"{BASE_URL}/experiences/batch",
             headers={"X-API-Key": API_KEY, "Content-Type": "application/json"},
-            json=l, timeout=30)
-        if r.status_code == 200:
-            uploaded += 1
-            print(f"[{uploaded}] ✓ {l['title'][:45]}")
-        else:
-            print(f"[FAIL] {l['title'][:45]} - {r.status_code}: {r.text[:50]}")
+            json=chunk, timeout=300)
+        if r.status_code != 200:
+            print(f"[FAIL] batch {i // BATCH + 1} - {r.status_code}: {r.text[:50]}")
+            continue
+        for l, res in zip(chunk, r.json()["results"]):
+            if res["status"] == "accepted":
+                uploaded += 1
+                print(f"[{uploaded}] ✓ {l['title'][:45]}")
+            else:
+                print(f"[{res['status'].upper()}] {l['title'][:45]} - {res.get('reason', '')[:50]}")
     except Exception as e:
-        print(f"[ERR] {l['title'][:45]} - {e}")
-    time.sleep(0.5)
+        print(f"[ERR] batch {i // BATCH + 1} - {e}")
 
 print(f"\nDone: {uploaded} uploaded")
 print("Checking total...")
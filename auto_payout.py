@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """Auto-payout USDC on Base - min 5 contributions"""
-import json, hashlib
+import json, hashlib, sqlite3
 from web3 import Web3
 
 RPC_URL = "https://mainnet.base.org"
@@ -11,7 +11,10 @@ PRIVATE_KEY = os.getenv("PAYOUT_PRIVATE_KEY")
 USDC_ADDRESS = "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913"
 REWARDS_FILE = "/app/data/rewards.json"
 INDEX_FILE = "/app/data/index.json"
+JOURNAL_FILES = ["/app/data/index.journal.old", "/app/data/index.journal"]
 AGENTS_FILE = "/app/data/agents.json"
+DB_FILE = "/app/data/uploade.db"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
 MIN_CONTRIBUTIONS = 5
 
 USDC_ABI = [
@@ -27,7 +30,37 @@ def load_json(f):
     with open(f) as file: return json.load(file)
 
 def save_json(f, d):
-    with open(f, 'w') as file: json.dump(d, file)
+    # replace atomically: the server re-reads rewards.json when it changes underneath it
+    with open(f + ".tmp", 'w') as file: json.dump(d, file)
+    os.replace(f + ".tmp", f)
+
+def load_entries():
+    # snapshot plus the journal tail the server has not compacted yet
+    entries = load_json(INDEX_FILE).get("entries", []) if os.path.exists(INDEX_FILE) else []
+    seen = {e["id"] for e in entries}
+    for path in JOURNAL_FILES:
+        if not os.path.exists(path): continue
+        with open(path) as file:
+            for line in file:
+                try: e = json.loads(line)
+                except ValueError: continue
+                if e["id"] not in seen: seen.add(e["id"]); entries.append(e)
+    return entries
+
+def load_db():
+    db = sqlite3.connect(DB_FILE)
+    rewards = {"wallets": dict(db.execute("SELECT agent_id, wallet FROM wallets")), "claims": dict(db.execute("SELECT agent_id, amount FROM claims"))}
+    entries = [json.loads(d) for (d,) in db.execute("SELECT data FROM entries")]
+    agents = dict(db.execute("SELECT hash, num FROM agents"))
+    db.close()
+    return rewards, entries, agents
+
+def save_db(claims):
+    db = sqlite3.connect(DB_FILE)
+    with db:
+        db.executemany("INSERT OR REPLACE INTO claims(agent_id, amount) VALUES(?, ?)", claims.items())
+        db.execute("DELETE FROM pending")
+    db.close()
 
 def get_agent_num(agent_id, agents):
     # agent_id might already be the hash key in agents.json
@@ -52,13 +85,13 @@ def send_usdc(to, amount_usd):
     return receipt.status == 1
 
 def process_payouts():
-    rewards = load_json(REWARDS_FILE)
-    index = load_json(INDEX_FILE)
-    agents = load_json(AGENTS_FILE)
+    if STORAGE_BACKEND == "sqlite":
+        rewards, entries, agents = load_db()
+    else:
+        rewards, entries, agents = load_json(REWARDS_FILE), load_entries(), load_json(AGENTS_FILE)
     
     wallets = rewards.get("wallets", {})
     claims = rewards.get("claims", {})
-    entries = index.get("entries", [])
     
     if not wallets:
         print("No wallets registered")
@@ -91,9 +124,12 @@ def process_payouts():
         except Exception as e:
             print(f"  ERR: {e}")
     
-    rewards["claims"] = claims
-    rewards["pending"] = []  # Clear pending, we auto-pay now
-    save_json(REWARDS_FILE, rewards)
+    if STORAGE_BACKEND == "sqlite":
+        save_db(claims)
+    else:
+        rewards["claims"] = claims
+        rewards["pending"] = []  # Clear pending, we auto-pay now
+        save_json(REWARDS_FILE, rewards)
     print(f"\nDone! {paid} agents paid")
 
 if __name__ == "__main__":
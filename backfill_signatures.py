@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""Compute near-duplicate signatures for experiences that do not have one yet. Run with the server stopped, against the configured STORAGE_BACKEND"""
+import sys
+import asyncio
+from app import Index, NearDuplicates, storage
+
+BATCH = 1000
+
+def title_and_content(e, md):
+    # bodies are "# title\n\nCategory/Type/Tags lines\n\ncontent"; the signature covers what create() sees
+    parts = md.split("\n\n", 2)
+    return f"{e['title']}\n{parts[2] if len(parts) == 3 else md}"
+
+async def backfill(rebuild=False):
+    await storage.open()
+    index = Index(); storage.load_index(index, text=False); storage.start(index)
+    have = {} if rebuild else dict(storage.load_signatures())
+    sigs = NearDuplicates(); done = []; missing = 0
+    todo = [e for e in index.entries if e["id"] not in have]
+    print(f"{len(have)} of {len(index.entries)} experiences already have a signature, computing {len(todo)}")
+    for n, e in enumerate(todo, 1):
+        try: md = await storage.read_body(e)
+        except FileNotFoundError:
+            missing += 1; continue
+        sig = sigs.signature(title_and_content(e, md))
+        if sig is not None: done.append((e["id"], sig))
+        if n % BATCH == 0: print(f"{n}/{len(todo)}")
+    storage.save_signatures([*have.items(), *done])
+    await storage.stop(index)
+    print(f"Wrote {len(done)} signatures ({missing} bodies missing).")
+
+if __name__ == "__main__":
+    asyncio.run(backfill(rebuild="--rebuild" in sys.argv[1:]))
@@ -411,16 +411,17 @@ def main():
                 headers={"X-API-Key": key, "Content-Type": "application/json"},
                 json=exp, timeout=30)
             
-            if r.status_code in (200, 201):
+            if r.status_code in (200, 201, 202):
                 uploaded += 1
                 print(f"[{uploaded}/{len(todo)}] OK: {exp['title'][:70]}")
             elif r.status_code == 429:
-                print(f"[RATE] Waiting 65s...")
-                time.sleep(65)
+                wait = int(r.headers.get("Retry-After", 65))
+                print(f"[RATE] Waiting {wait}s...")
+                time.sleep(wait)
                 r = requests.post(f"{BASE}/experiences",
                     headers={"X-API-Key": key, "Content-Type": "application/json"},
                     json=exp, timeout=30)
-                if r.status_code in (200, 201):
+                if r.status_code in (200, 201, 202):
                     uploaded += 1
                     print(f"[{uploaded}/{len(todo)}] OK (retry): {exp['title'][:70]}")
                 else:
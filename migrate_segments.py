@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""Move experience bodies from the one-file-per-body tree (data/experiences/<category>/<id>.md) into segment files. Run with the server stopped"""
+import sys
+import asyncio
+from app import Index, JsonStorage, DATA_DIR
+
+async def migrate(root=DATA_DIR, delete=False):
+    st, index = JsonStorage(root), Index()
+    await st.open(); st.load_index(index, text=False)
+    seg = st.segments; moved = []; missing = 0
+    todo = [e for e in index.entries if e["id"] not in seg]
+    print(f"{len(index.entries) - len(todo)} of {len(index.entries)} bodies already in segments, moving {len(todo)}")
+    for n, e in enumerate(todo, 1):
+        p = st.body_path(e)
+        # the file's bytes as they are; segment reads apply the same newline handling reading the file did
+        try: seg.append(e["id"], p.read_bytes())
+        except FileNotFoundError:
+            missing += 1; continue
+        moved.append(e)
+        if n % 10000 == 0: print(f"{n}/{len(todo)}")
+    seg.sync()
+    # what GET /experiences/{id} served before must be what it serves now
+    bad = [e["id"] for e in moved if seg.read(e["id"]) != st.body_path(e).read_text()]
+    seg.close()
+    if bad: sys.exit(f"{len(bad)} bodies read back differently (first: {bad[0]}); the .md files were left in place")
+    if delete:
+        for e in moved: st.body_path(e).unlink()
+        for d in st.exp_dir.glob("*/"):
+            if not any(d.iterdir()): d.rmdir()
+    print(f"Moved {len(moved)} bodies into {seg.root} ({missing} missing){', removed their .md files' if delete else ''}.")
+
+if __name__ == "__main__":
+    asyncio.run(migrate(delete="--delete" in sys.argv[1:]))
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""One-shot migration of the JSON data layout into the SQLite backend"""
+import sys
+import asyncio
+from app import Index, JsonStorage, SqliteStorage, DATA_DIR, SQLITE_FILE
+
+BATCH = 1000
+
+async def migrate(src=DATA_DIR, dst=SQLITE_FILE):
+    if dst.exists():
+        sys.exit(f"{dst} already exists, refusing to overwrite")
+    old, new, index = JsonStorage(src), SqliteStorage(dst), Index()
+    await old.open(); old.load_index(index, text=False)
+    await new.open()
+    batch = []
+    for n, e in enumerate(index.entries, 1):
+        try: md = await old.read_body(e)
+        except FileNotFoundError:
+            print(f"missing body for {e['id']}, skipped")
+            continue
+        batch.append((e, md))
+        if len(batch) >= BATCH:
+            new.append_many(batch); batch = []
+            print(f"{n}/{len(index.entries)} entries")
+    if batch: new.append_many(batch)
+    await new.save_agents(await old.load_agents())
+    await new.save_api_keys(await old.load_api_keys())
+    await new.save_rewards(await old.load_rewards())
+    await new.stop(index)
+    print(f"Migrated {len(index.entries)} entries into {dst}. Start the app with STORAGE_BACKEND=sqlite.")
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
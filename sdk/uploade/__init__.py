@@ -1,9 +1,10 @@
 import requests
+import json
 import time
 import warnings
 import os
 
-__version__ = "1.8.0"
+__version__ = "2.0.0"
 
 def check_update():
     try:
@@ -75,7 +76,8 @@ class Uploade:
         self._cache_time[key] = now
         return data
 
-    def share(self, category, title, content, tags, type="lesson"):
+    def share(self, category, title, content, tags, type="lesson", wait=True, timeout=120):
+        """Submit an experience for review. With wait=True, poll until the review finishes and return the accepted id."""
         if not self.api_key:
             raise ValueError("API key required. Use register() or pass api_key to constructor.")
         r = requests.post(f"{self.url}/experiences", 
@@ -88,15 +90,39 @@ class Uploade:
                 "type": type
             }, timeout=10)
         r.raise_for_status()
+        sub = r.json()
+        if not wait:
+            return sub
+        deadline = time.time() + timeout
+        while sub["status"] == "pending" and time.time() < deadline:
+            time.sleep(1)
+            sub = self.submission(sub["submission_id"])
+        if sub["status"] != "accepted":
+            raise ValueError(f"Upload {sub['status']}: {sub.get('reason', 'review still pending')}")
+        return sub
+
+    def share_many(self, experiences):
+        """Submit up to 50 experiences (dicts with the share() fields) in one request. Returns one result per item, in order, once all are reviewed."""
+        if not self.api_key:
+            raise ValueError("API key required. Use register() or pass api_key to constructor.")
+        items = [{**x, "tags": x["tags"] if isinstance(x["tags"], list) else [x["tags"]], "type": x.get("type", "lesson")} for x in experiences]
+        r = requests.post(f"{self.url}/experiences/batch", headers={"X-API-Key": self.api_key}, json=items, timeout=300)
+        r.raise_for_status()
+        return r.json()["results"]
+
+    def submission(self, submission_id):
+        r = requests.get(f"{self.url}/submissions/{submission_id}", timeout=10)
+        r.raise_for_status()
         return r.json()
 
-    def search(self, category=None, tags=None, type=None, q=None, limit=50):
+    def search(self, category=None, tags=None, type=None, q=None, limit=50, sort=None):
         params = {"limit": limit}
         if category: params["category"] = category
         if tags: params["tags"] = ",".join(tags) if isinstance(tags, list) else tags
         if type: params["type"] = type
         if q: params["q"] = q
-        key = f"search:{category}:{tags}:{type}:{q}:{limit}"
+        if sort: params["sort"] = sort
+        key = f"search:{category}:{tags}:{type}:{q}:{limit}:{sort}"
         return self._cached_get(key, f"{self.url}/experiences", params)
 
     def warnings(self, category, tags=None, limit=20):
@@ -117,11 +143,51 @@ class Uploade:
         key = f"sol:{category}:{tags}:{limit}"
         return self._cached_get(key, f"{self.url}/solutions/{category}", params)
 
+    def similar(self, text, category=None, limit=10):
+        """Experiences whose title and tags resemble `text` (an error message or a description), best match first, each with a score."""
+        params = {"text": text, "limit": limit}
+        if category: params["category"] = category
+        key = f"similar:{text}:{category}:{limit}"
+        return self._cached_get(key, f"{self.url}/experiences/similar", params)
+
+    def facets(self, category=None, type=None):
+        """How many experiences exist per category, type and tag, as {"total", "categories", "types", "tags"}; with a category and/or type, counted within it."""
+        params = {}
+        if category: params["category"] = category
+        if type: params["type"] = type
+        key = f"facets:{category}:{type}"
+        return self._cached_get(key, f"{self.url}/stats/facets", params)
+
+    def export(self, category=None, tags=None, type=None, q=None):
+        """Iterate over every matching experience, newest first, streamed as NDJSON."""
+        params = {"format": "ndjson"}
+        if category: params["category"] = category
+        if tags: params["tags"] = ",".join(tags) if isinstance(tags, list) else tags
+        if type: params["type"] = type
+        if q: params["q"] = q
+        with requests.get(f"{self.url}/experiences", params=params, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if line: yield json.loads(line)
+
     def get(self, id):
         r = requests.get(f"{self.url}/experiences/{id}", timeout=10)
         r.raise_for_status()
         return r.text
 
+    def get_many(self, ids):
+        """Bodies of several experiences in as few requests as the server allows, as {id: markdown}. Unknown ids are left out."""
+        out = {}
+        todo = list(dict.fromkeys(ids))
+        while todo:
+            chunk, todo = todo[:100], todo[100:]
+            r = requests.get(f"{self.url}/experiences/bulk", params={"ids": ",".join(chunk)}, timeout=30)
+            r.raise_for_status()
+            data = r.json()
+            out.update(data["bodies"])
+            todo = data["omitted"] + todo
+        return out
+
     def clear_cache(self):
         self._cache = {}
         self._cache_time = {}
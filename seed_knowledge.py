@@ -138,8 +138,8 @@ def upload_learning(api_key, learning):
             json=learning,
             timeout=30
         )
-        if r.status_code == 201:
-            return True, r.json().get("id", "ok")
+        if r.status_code in (201, 202):
+            return True, r.json().get("submission_id", "ok")
         elif r.status_code == 429:
             return False, "rate_limited"
         else:
@@ -83,8 +83,8 @@ def upload(api_key, learning):
         r = requests.post(f"{BASE_URL}/experiences",
             headers={"X-API-Key": api_key, "Content-Type": "application/json"},
             json=learning, timeout=30)
-        if r.status_code == 201:
-            return True, r.json().get("id")
+        if r.status_code in (201, 202):
+            return True, r.json().get("submission_id")
         elif r.status_code == 429:
             return False, "rate_limit"
         else:
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""Train the zstd dictionary experience bodies are stored with from the existing corpus, then recompress the segment files with it. Run with the server stopped"""
+import sys
+import random
+import asyncio
+import zstandard as zstd
+from app import Index, JsonStorage, DATA_DIR, STORAGE_BACKEND
+
+SAMPLES = 20000
+
+async def train(root=DATA_DIR, rewrite=True):
+    if STORAGE_BACKEND != "json":
+        sys.exit("Bodies are compressed in the JSON backend's segment files; the SQLite backend keeps them in its full-text indexed table.")
+    st, index = JsonStorage(root), Index()
+    await st.open(); st.load_index(index, text=False)
+    seg = st.segments; before = seg.info()["bytes"]
+    ids = [e["id"] for e in index.entries if e["id"] in seg]
+    if len(ids) < len(index.entries): print(f"{len(index.entries) - len(ids)} bodies are still .md files and are left out; migrate_segments.py moves them")
+    sample = [seg.raw(i) for i in random.Random(0).sample(ids, min(SAMPLES, len(ids)))]
+    try: seg.train(sample)
+    except zstd.ZstdError as ex:
+        seg.close(); sys.exit(f"Could not train a dictionary from {len(sample)} bodies: {ex}")
+    print(f"Trained dictionary {seg.dict_id} from {len(sample)} bodies.")
+    if rewrite:
+        seg.rewrite(); print(f"Recompressed {len(ids)} bodies: {before / 2**20:.1f} MB -> {seg.info()['bytes'] / 2**20:.1f} MB.")
+    seg.close()
+
+if __name__ == "__main__":
+    asyncio.run(train(rewrite="--no-rewrite" not in sys.argv[1:]))